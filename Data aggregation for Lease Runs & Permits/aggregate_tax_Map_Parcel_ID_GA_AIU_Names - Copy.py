@@ -1,43 +1,64 @@
-import pandas as pd
+import python_calamine
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
-import glob
+import numba
+from parcel_aggregation import read_columns, aggregate, write_excel
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-def aggregate_data(input_file, output_file, sheet_name='Mapping'):
+def aggregate_data(input_file, output_file, sheet_name='Mapping', output_format='parquet'):
     """
     Aggregates data from an input Excel file and saves the result to an output file.
     
     Parameters:
         input_file (str): Path to the input Excel file.
-        output_file (str): Path to the output Excel file.
+        output_file (str): Path to the output file. The extension is replaced with '.parquet' for Parquet output.
         sheet_name (str): Sheet name to process from the input file.
+        output_format (str): 'parquet' for downstream processing, or 'xlsx' when the workbook is needed for review.
     """
-    # Load the data
+    if output_format not in ('parquet', 'xlsx'):
+        raise ValueError(f"Unsupported output format '{output_format}', expected 'parquet' or 'xlsx'.")
+
+    # Stream only the columns we aggregate, collapsing repeated rows as they are read
     print(f"Loading data from {input_file}...")
-    data = pd.read_excel(input_file, sheet_name=sheet_name)
-    
-    # Clean column names
-    data.columns = data.columns.str.strip()
+    with python_calamine.CalamineWorkbook.from_path(input_file) as workbook:
+        data = read_columns(workbook.get_sheet_by_name(sheet_name),
+                            ['Tax Map Parcel ID', 'Name', 'Acres in Unit', 'Gross acres'])
+    # Raises a KeyError naming any column the sheet is missing
+    data = data[['Tax Map Parcel ID', 'Name', 'Acres in Unit', 'Gross acres']]
     
     # Group and aggregate the data
     print("Aggregating data...")
-    aggregated_data = data.groupby(['Tax Map Parcel ID'], dropna=False).agg({
-        'Name': lambda x: ';'.join(x.dropna().unique()),  # Concatenate unique names
-        'Acres in Unit': lambda x: ','.join(map(str, x.dropna().unique())),  # Concatenate unique acre values
-        'Gross acres': lambda x: ','.join(map(str, x.dropna().unique()))  # Concatenate unique gross acre values
-    }).reset_index()
-    
-    # Rename columns to match desired output
-    aggregated_data.rename(columns={
-        'Name': 'Names',
-        'Acres in Unit': 'Acres in Unit',
-        'Gross acres': 'Gross Acres'
-    }, inplace=True)
+    aggregated_data = aggregate(data, 'Tax Map Parcel ID')
     
-    # Save the aggregated data to a new Excel file
-    print(f"Saving aggregated data to {output_file}...")
-    aggregated_data.to_excel(output_file, index=False)
+    # Save the aggregated data, only paying for the Excel writer when asked to
+    if output_format == 'parquet':
+        output_file = os.path.splitext(output_file)[0] + '.parquet'
+        print(f"Saving aggregated data to {output_file}...")
+        pq.write_table(pa.Table.from_pandas(aggregated_data, preserve_index=False), output_file, compression='zstd')
+    else:
+        print(f"Saving aggregated data to {output_file}...")
+        write_excel(aggregated_data, output_file)
     print(f"Aggregation complete for {input_file}!")
 
+def _process_one(input_file, output_directory):
+    """
+    Aggregates a single input file into the output directory, reporting any failure.
+    
+    Parameters:
+        input_file (str): Path to the input Excel file.
+        output_directory (str): Directory the aggregated file is written to.
+    """
+    # Generate output file name
+    file_name = os.path.basename(input_file)
+    output_file = os.path.join(output_directory, f"aggregated_{file_name}")
+    
+    try:
+        aggregate_data(input_file, output_file)
+    except Exception as e:
+        print(f"Error processing {input_file}: {e}")
+
 if __name__ == "__main__":
     # Directory containing input files
     input_directory = "input_folder"  # Replace with your input folder path
@@ -46,19 +67,17 @@ if __name__ == "__main__":
     # Create output directory if it doesn't exist
     os.makedirs(output_directory, exist_ok=True)
 
-    # Get all Excel files from the input directory
-    input_files = glob.glob(os.path.join(input_directory, "*.xlsx"))
+    # Get all Excel files from the input directory, whatever the case of their extension, skipping the
+    # lock files (~$name.xlsx) of open workbooks and hidden files such as macOS resource forks (._name.xlsx)
+    input_files = [entry.path for entry in os.scandir(input_directory)
+                   if entry.is_file() and entry.name.lower().endswith('.xlsx') and not entry.name.startswith(('~$', '.'))]
 
     if not input_files:
         print("No Excel files found in the input directory.")
     else:
-        # Process each file
-        for input_file in input_files:
-            # Generate output file name
-            file_name = os.path.basename(input_file)
-            output_file = os.path.join(output_directory, f"aggregated_{file_name}")
-            
-            try:
-                aggregate_data(input_file, output_file)
-            except Exception as e:
-                print(f"Error processing {input_file}: {e}")
+        # Process the files in parallel, recycling workers to bound memory growth (max_tasks_per_child
+        # needs Python 3.11+). The files already keep every core busy, so each worker runs the Numba
+        # kernels on a single thread instead of starting a thread pool of its own.
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), max_tasks_per_child=4,
+                                 initializer=numba.set_num_threads, initargs=(1,)) as pool:
+            list(pool.map(partial(_process_one, output_directory=output_directory), input_files))
@@ -1,39 +1,42 @@
-import pandas as pd
+import python_calamine
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+from parcel_aggregation import read_columns, aggregate, write_excel
 
-def aggregate_data(input_file, output_file, sheet_name='Mapping'):
+def aggregate_data(input_file, output_file, sheet_name='Mapping', output_format='parquet'):
     """
     Aggregates data from an input Excel file and saves the result to an output file.
     
     Parameters:
         input_file (str): Path to the input Excel file.
-        output_file (str): Path to the output Excel file.
+        output_file (str): Path to the output file. The extension is replaced with '.parquet' for Parquet output.
         sheet_name (str): Sheet name to process from the input file.
+        output_format (str): 'parquet' for downstream processing, or 'xlsx' when the workbook is needed for review.
     """
-    # Load the data
+    if output_format not in ('parquet', 'xlsx'):
+        raise ValueError(f"Unsupported output format '{output_format}', expected 'parquet' or 'xlsx'.")
+
+    # Stream only the columns we aggregate, collapsing repeated rows as they are read
     print("Loading data...")
-    data = pd.read_excel(input_file, sheet_name=sheet_name)
-    
-    # Clean column names
-    data.columns = data.columns.str.strip()
+    with python_calamine.CalamineWorkbook.from_path(input_file) as workbook:
+        data = read_columns(workbook.get_sheet_by_name(sheet_name),
+                            ['Tax Map Parcel ID', 'Name', 'Acres in Unit', 'Gross acres'])
+    # Raises a KeyError naming any column the sheet is missing
+    data = data[['Tax Map Parcel ID', 'Name', 'Acres in Unit', 'Gross acres']]
     
     # Group and aggregate the data
     print("Aggregating data...")
-    aggregated_data = data.groupby(['Tax Map Parcel ID'], dropna=False).agg({
-        'Name': lambda x: ';'.join(x.dropna().unique()),  # Concatenate unique names
-        'Acres in Unit': lambda x: ','.join(map(str, x.dropna().unique())),  # Concatenate unique acre values
-        'Gross acres': lambda x: ','.join(map(str, x.dropna().unique()))  # Concatenate unique gross acre values
-    }).reset_index()
-    
-    # Rename columns to match desired output
-    aggregated_data.rename(columns={
-        'Name': 'Names',
-        'Acres in Unit': 'Acres in Unit',
-        'Gross acres': 'Gross Acres'
-    }, inplace=True)
+    aggregated_data = aggregate(data, 'Tax Map Parcel ID')
     
-    # Save the aggregated data to a new Excel file
-    print(f"Saving aggregated data to {output_file}...")
-    aggregated_data.to_excel(output_file, index=False)
+    # Save the aggregated data, only paying for the Excel writer when asked to
+    if output_format == 'parquet':
+        output_file = os.path.splitext(output_file)[0] + '.parquet'
+        print(f"Saving aggregated data to {output_file}...")
+        pq.write_table(pa.Table.from_pandas(aggregated_data, preserve_index=False), output_file, compression='zstd')
+    else:
+        print(f"Saving aggregated data to {output_file}...")
+        write_excel(aggregated_data, output_file)
     print("Aggregation complete!")
 
 # Example usage
@@ -1,30 +1,54 @@
+import numpy as np
 import pandas as pd
 import os
-import glob
+import sys
+import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
 import arcpy
+import python_calamine
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def aggregate_data(input_file, output_file):
+# The aggregation helpers are shared with the standalone scripts one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parcel_aggregation import read_columns, aggregate, write_excel
+
+# Sheets searched for the lead data, in order of preference
+SHEET_NAMES = ('Mapping', 'Lead List')
+
+# Bumped whenever the aggregated values change, so caches written by older versions are rebuilt.
+# 2: whole-number cells are read as ints
+# 3: columns stay ints when they have blank cells, so numeric parcel IDs never end in '.0', and
+#    read_excel's NA strings ('N/A', 'NULL', ...) are treated as missing
+CACHE_VERSION = 3
+
+def pick_sheet(zip_path, preferred=SHEET_NAMES):
     """
-    Aggregates data from an input Excel file and saves the result to an output file.
+    Returns the first preferred sheet present in a workbook, or None, reading only the workbook index.
+    
+    Parameters:
+        zip_path (str): Path to the .xlsx workbook.
+        preferred (tuple): Sheet names to look for, in order of preference.
+    """
+    # xl/workbook.xml lists every sheet by name and is tiny compared to the sheets themselves
+    with zipfile.ZipFile(zip_path) as archive, archive.open('xl/workbook.xml') as workbook_xml:
+        names = {element.get('name') for _, element in ET.iterparse(workbook_xml) if element.tag.endswith('}sheet')}
+    return next((name for name in preferred if name in names), None)
+
+def aggregate_data(input_file, output_file, workbook, sheet_name):
+    """
+    Aggregates data from an input Excel file, saves the result to an output file and returns it.
     
     Parameters:
         input_file (str): Path to the input Excel file.
         output_file (str): Path to the output Excel file.
+        workbook (python_calamine.CalamineWorkbook): Workbook already opened from input_file.
+        sheet_name (str): Sheet to aggregate, as returned by pick_sheet.
     """
-    arcpy.AddMessage(f"Loading sheet names from {input_file}...")
-    xl = pd.ExcelFile(input_file)
-    
-    if 'Mapping' in xl.sheet_names:
-        sheet_name = 'Mapping'
-    elif 'Lead List' in xl.sheet_names:
-        sheet_name = 'Lead List'
-    else:
-        arcpy.AddError(f"Neither 'Mapping' nor 'Lead List' sheet is present in {input_file}.")
-        return
-
     arcpy.AddMessage(f"Using '{sheet_name}' sheet for processing.")
-    data = xl.parse(sheet_name)
-    data.columns = data.columns.str.strip()
+    data = read_columns(workbook.get_sheet_by_name(sheet_name),
+                        ['Tax Map Parcel ID', 'TPIN', 'Name', 'Acres in Unit', 'Gross acres'])
 
     if 'Tax Map Parcel ID' in data.columns:
         group_column = 'Tax Map Parcel ID'
@@ -44,57 +68,153 @@ def aggregate_data(input_file, output_file):
         arcpy.AddWarning(f"'Gross acres' column is missing in {input_file}. Filling with empty strings.")
         data['Gross acres'] = ""
 
+    data = data[[group_column, 'Name', 'Acres in Unit', 'Gross acres']]
+
     arcpy.AddMessage("Aggregating data...")
-    aggregated_data = data.groupby([group_column], dropna=False).agg({
-        'Name': lambda x: ';'.join(x.dropna().unique()),
-        'Acres in Unit': lambda x: ','.join(map(str, x.dropna().unique())),
-        'Gross acres': lambda x: ','.join(map(str, x.dropna().unique()))
-    }).reset_index()
-
-    aggregated_data.rename(columns={
-        'Name': 'Names',
-        'Acres in Unit': 'Acres in Unit',
-        'Gross acres': 'Gross Acres'
-    }, inplace=True)
+    aggregated_data = aggregate(data, group_column)
 
     arcpy.AddMessage(f"Saving aggregated data to {output_file}...")
-    aggregated_data.to_excel(output_file, index=False)
+    write_excel(aggregated_data, output_file)
     arcpy.AddMessage(f"Aggregation complete for {input_file}!")
+    return aggregated_data
+
+def cache_path(output_file, sheet_name):
+    """
+    Returns the Parquet cache path for an aggregated output, keyed on the cache version and the sheet it was read from.
+    
+    Parameters:
+        output_file (str): Path to the output Excel file.
+        sheet_name (str): Sheet the data is aggregated from.
+    """
+    key = hashlib.sha1(f"{CACHE_VERSION}|{sheet_name}".encode()).hexdigest()[:8]
+    return f"{os.path.splitext(output_file)[0]}.{key}.parquet"
+
+def source_stamp(input_file):
+    """
+    Returns the modification time and size of an input file, which identify the contents a cache was built from.
+    
+    Parameters:
+        input_file (str): Path to the input Excel file.
+    """
+    stat = os.stat(input_file)
+    return f"{stat.st_mtime_ns}:{stat.st_size}".encode()
+
+def read_cache(cache_file, stamp):
+    """
+    Returns the cached aggregation if it was built from an input with the given stamp, otherwise None.
+    
+    Parameters:
+        cache_file (str): Path returned by cache_path.
+        stamp (bytes): Stamp of the input file, as returned by source_stamp.
+    """
+    if not os.path.exists(cache_file):
+        return None
+    # The stamp is kept in the Parquet footer, so a stale cache is rejected without reading any rows
+    metadata = pq.read_schema(cache_file).metadata or {}
+    if metadata.get(b'source_stamp') != stamp:
+        return None
+    return pq.read_table(cache_file).to_pandas()
+
+def write_cache(cache_file, aggregated_data, stamp):
+    """
+    Saves the aggregation to its cache file, recording the stamp of the input it was built from.
+    
+    Parameters:
+        cache_file (str): Path returned by cache_path.
+        aggregated_data (pandas.DataFrame): Aggregated data returned by aggregate_data.
+        stamp (bytes): Stamp of the input file, as returned by source_stamp.
+    """
+    table = pa.Table.from_pandas(aggregated_data, preserve_index=False)
+    pq.write_table(table.replace_schema_metadata({**table.schema.metadata, b'source_stamp': stamp}), cache_file)
+
+# numpy types for the arcpy field types a numeric parcel key can be joined on
+NUMERIC_FIELD_TYPES = {'SmallInteger': 'int64', 'Integer': 'int64', 'BigInteger': 'int64',
+                       'Single': 'float64', 'Double': 'float64'}
+INT64_MIN, INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+def numeric_key(text, integer):
+    """
+    Returns a parcel key as a number for a numeric join field, or None when it cannot match one.
+    
+    Parameters:
+        text (str): Aggregated parcel key, or None when missing.
+        integer (bool): Whether the join field holds integers.
+    """
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    if not np.isfinite(value):
+        return None
+    if not integer:
+        return value
+    if not value.is_integer():
+        return None
+    # Parse plain digit strings exactly, since a float only holds 15-16 significant digits
+    value = int(text) if text.strip().lstrip('+-').isdigit() else int(value)
+    return value if INT64_MIN <= value <= INT64_MAX else None
 
-def join_to_shapefile(shapefile, excel_file, group_column, output_layer):
+def to_records(aggregated_data, key_dtype=None):
     """
-    Joins the aggregated Excel data to a shapefile based on a common column and validates the join.
+    Converts the aggregated data to a structured array with each text field sized to its longest value.
+    
+    Parameters:
+        aggregated_data (pandas.DataFrame): Aggregated data returned by aggregate_data.
+        key_dtype (str): numpy type to give the parcel key (the first column), or None to keep it as text.
+    """
+    columns = {}
+    if key_dtype is not None:
+        # The aggregated key is text. Drop the keys that can never match a numeric field rather than let numpy
+        # truncate or wrap them: text that is not a number, and for integer fields fractions and out of range values.
+        key_column = aggregated_data.columns[0]
+        integer = np.dtype(key_dtype).kind == 'i'
+        keys = [numeric_key(text, integer) for text in aggregated_data[key_column].to_numpy(dtype=object, na_value=None)]
+        aggregated_data = aggregated_data[np.array([key is not None for key in keys], dtype=bool)]
+        columns[key_column] = np.array([key for key in keys if key is not None], dtype=key_dtype)
+    for column in aggregated_data.columns:
+        if column in columns:
+            continue
+        values = aggregated_data[column].fillna('')
+        width = max(int(values.str.len().max()) if len(values) else 0, 1)
+        columns[column] = values.to_numpy(dtype=f'U{width}')
+
+    records = np.empty(len(aggregated_data), dtype=[(column, values.dtype) for column, values in columns.items()])
+    for column, values in columns.items():
+        records[column] = values
+    return records
+
+def join_to_shapefile(shapefile, aggregated_data, group_column, output_layer):
+    """
+    Joins the aggregated data to a shapefile based on a common column and validates the join.
     
     Parameters:
         shapefile (str): Path to the shapefile.
-        excel_file (str): Path to the aggregated Excel file.
+        aggregated_data (pandas.DataFrame): Aggregated data returned by aggregate_data.
         group_column (str): Column used for the join (e.g., 'Tax Map Parcel ID').
         output_layer (str): Path to save the output layer.
     """
-    arcpy.AddMessage(f"Joining data from {excel_file} to {shapefile}...")
-
-    # Convert Excel to a table
-    excel_table = os.path.splitext(excel_file)[0] + ".dbf"
-    arcpy.conversion.ExcelToTable(excel_file, excel_table)
+    arcpy.AddMessage(f"Joining aggregated data to {shapefile}...")
 
-    # Perform the join
-    arcpy.management.AddJoin(shapefile, group_column, excel_table, group_column)
+    # Copy the features once, then append the aggregated columns to the copy in a single pass
+    arcpy.management.CopyFeatures(shapefile, output_layer)
+    # Give the key the join field's type, so numeric parcel fields still match the text keys
+    key_dtype = NUMERIC_FIELD_TYPES.get(arcpy.ListFields(output_layer, group_column)[0].type)
+    arcpy.da.ExtendTable(output_layer, group_column, to_records(aggregated_data, key_dtype),
+                         aggregated_data.columns[0], append_only=False)
     arcpy.AddMessage("Join operation completed.")
 
-    # Validate the join
-    joined_fields = [f.name for f in arcpy.ListFields(shapefile)]
+    # Validate the join, allowing for the field names the output format accepts
+    workspace = os.path.dirname(output_layer)
+    joined_fields = [f.name for f in arcpy.ListFields(output_layer)]
     required_fields = ['Names', 'Acres in Unit', 'Gross Acres']
 
-    missing_fields = [field for field in required_fields if field not in joined_fields]
+    missing_fields = [field for field in required_fields
+                      if arcpy.ValidateFieldName(field, workspace) not in joined_fields]
     if missing_fields:
         arcpy.AddError(f"Join validation failed. Missing fields: {', '.join(missing_fields)}.")
         return
 
-    arcpy.AddMessage(f"Join validation passed. Exporting to {output_layer}...")
-
-    # Save the joined layer to a new file
-    arcpy.management.CopyFeatures(shapefile, output_layer)
-    arcpy.AddMessage(f"Joined data saved to {output_layer}.")
+    arcpy.AddMessage(f"Join validation passed. Joined data saved to {output_layer}.")
 
 if __name__ == "__main__":
     arcpy.env.workspace = arcpy.GetParameterAsText(0)  # Input workspace for Excel files
@@ -104,7 +224,10 @@ if __name__ == "__main__":
     group_column = arcpy.GetParameterAsText(4)  # Join column, e.g., 'Tax Map Parcel ID'
 
     os.makedirs(output_directory, exist_ok=True)
-    input_files = glob.glob(os.path.join(arcpy.env.workspace, "*.xlsx"))
+    # Match the extension in any case as glob does on Windows, skipping Excel lock files (~$name.xlsx)
+    # left behind by open workbooks and hidden files such as macOS resource forks (._name.xlsx)
+    input_files = [entry.path for entry in os.scandir(arcpy.env.workspace)
+                   if entry.is_file() and entry.name.lower().endswith('.xlsx') and not entry.name.startswith(('~$', '.'))]
 
     if not input_files:
         arcpy.AddError("No Excel files found in the input directory.")
@@ -114,10 +237,29 @@ if __name__ == "__main__":
             output_file = os.path.join(output_directory, f"aggregated_{file_name}")
 
             try:
-                # Aggregate the data
-                aggregate_data(input_file, output_file)
+                # Find the sheet from the workbook index alone, before anything else is parsed
+                arcpy.AddMessage(f"Loading sheet names from {input_file}...")
+                sheet_name = pick_sheet(input_file)
+                if sheet_name is None:
+                    arcpy.AddError(f"Neither 'Mapping' nor 'Lead List' sheet is present in {input_file}.")
+                    continue
+
+                cache_file = cache_path(output_file, sheet_name)
+                stamp = source_stamp(input_file)
+                # Only reuse the cache while the review workbook it was written alongside still exists
+                aggregated_data = read_cache(cache_file, stamp) if os.path.exists(output_file) else None
+                if aggregated_data is not None:
+                    # The input has the same modification time and size as when it was last aggregated
+                    arcpy.AddMessage(f"Reusing cached aggregation {cache_file} for {input_file}.")
+                else:
+                    # Open the workbook once and aggregate the data from it
+                    with python_calamine.CalamineWorkbook.from_path(input_file) as workbook:
+                        aggregated_data = aggregate_data(input_file, output_file, workbook, sheet_name)
+                    if aggregated_data is not None:
+                        write_cache(cache_file, aggregated_data, stamp)
 
                 # Join the output to the shapefile
-                join_to_shapefile(shapefile, output_file, group_column, output_layer)
+                if aggregated_data is not None:
+                    join_to_shapefile(shapefile, aggregated_data, group_column, output_layer)
             except Exception as e:
                 arcpy.AddError(f"Error processing {input_file}: {e}")
@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+import sys
+import xlsxwriter
+
+# Cell text read_excel treats as missing by default (pandas' STR_NA_VALUES), kept here rather than
+# imported from pandas' private modules
+NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+})
+
+# Groups handled by each parallel task of fuse_agg, which share one hash set
+GROUPS_PER_CHUNK = 1024
+
+@njit(cache=True)
+def unique_run(values, start, end, table, mask, out):
+    """
+    Writes the distinct non-missing values of values[start:end] to out[start:] in first-seen order.
+    
+    Parameters:
+        values (numpy.ndarray): Factorized values, -1 for missing.
+        start (int): First row of the run.
+        end (int): Row just past the run.
+        table (numpy.ndarray): Empty open-addressed hash set (all -1) with mask + 1 slots, left empty again on return.
+        mask (int): Slot count minus one, a power of two minus one.
+        out (numpy.ndarray): Output buffer written from position start.
+    
+    Returns the number of distinct values written.
+    """
+    count = 0
+    for i in range(start, end):
+        value = np.int64(values[i])
+        if value < 0:
+            continue
+        slot = (value * 2654435761) & mask
+        while table[slot] != -1 and table[slot] != value:
+            slot = (slot + 1) & mask
+        if table[slot] == -1:
+            table[slot] = value
+            out[start + count] = value
+            count += 1
+
+    # Clear only the slots this run used so the table can be reused
+    for i in range(start, start + count):
+        slot = (out[i] * 2654435761) & mask
+        while table[slot] != out[i]:
+            slot = (slot + 1) & mask
+        table[slot] = -1
+    return count
+
+@njit(parallel=True, cache=True)
+def fuse_agg(name_codes, acre_codes, gross_codes, edges,
+             out_name_ids, out_acre_ids, out_gross_ids, out_name_counts, out_acre_counts, out_gross_counts):
+    """
+    Collects the distinct name, acre and gross acre codes of every group in one parallel pass over chunks of groups.
+    
+    Parameters:
+        name_codes, acre_codes, gross_codes (numpy.ndarray): Factorized values sorted by group, -1 for missing.
+        edges (numpy.ndarray): Start row of every group followed by the total row count.
+        out_name_ids, out_acre_ids, out_gross_ids (numpy.ndarray): Buffers as long as the codes. Group i writes its
+            distinct codes from edges[i], so groups never overlap.
+        out_name_counts, out_acre_counts, out_gross_counts (numpy.ndarray): Number of distinct codes of each group.
+    """
+    n_groups = len(edges) - 1
+    for chunk in prange((n_groups + GROUPS_PER_CHUNK - 1) // GROUPS_PER_CHUNK):
+        first = chunk * GROUPS_PER_CHUNK
+        last = min(first + GROUPS_PER_CHUNK, n_groups)
+
+        # One hash set per chunk, sized for its largest group at half load. Most parcels have only a few
+        # rows, so reusing the set (unique_run leaves it empty) saves an allocation for every group.
+        largest = 0
+        for group in range(first, last):
+            largest = max(largest, edges[group + 1] - edges[group])
+        mask = 1
+        while mask < 2 * largest:
+            mask *= 2
+        mask -= 1
+        table = np.full(mask + 1, -1, dtype=np.int64)
+
+        for group in range(first, last):
+            start = edges[group]
+            end = edges[group + 1]
+            out_name_counts[group] = unique_run(name_codes, start, end, table, mask, out_name_ids)
+            out_acre_counts[group] = unique_run(acre_codes, start, end, table, mask, out_acre_ids)
+            out_gross_counts[group] = unique_run(gross_codes, start, end, table, mask, out_gross_ids)
+
+def join_unique(ids, counts, edges, values, sep):
+    """
+    Joins the unique non-null values of each group into an Arrow-backed string array.
+    
+    Parameters:
+        ids (numpy.ndarray): Distinct codes written by fuse_agg, group i's starting at edges[i].
+        counts (numpy.ndarray): Number of distinct codes of each group.
+        edges (numpy.ndarray): Start row of every group followed by the total row count.
+        values (numpy.ndarray): Values the codes index into.
+        sep (str): Separator placed between the unique values.
+    """
+    # Keep only the written part of each group's slice and decode it in a single take
+    lengths = np.diff(edges)
+    written = np.arange(edges[-1]) - np.repeat(edges[:-1], lengths) < np.repeat(counts, lengths)
+    joined = values[ids[written]]
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return pd.array([sep.join(joined[start:end]) for start, end in zip(offsets[:-1], offsets[1:])],
+                    dtype='string[pyarrow]')
+
+def read_columns(sheet, columns):
+    """
+    Streams a worksheet row by row, keeping only the requested columns and the distinct rows among them.
+    
+    Parameters:
+        sheet (python_calamine.CalamineSheet): Worksheet whose first non-empty row holds the column names.
+        columns (list): Column names to keep. Names not present in the sheet are left out of the result.
+    """
+    rows = sheet.iter_rows()
+    header = next((row for row in rows if any(cell != '' for cell in row)), [])
+
+    # Map each wanted column to its position, stripping only labels that do not already match
+    wanted = set(columns)
+    found = {}
+    for position, label in enumerate(header):
+        if label not in wanted and isinstance(label, str):
+            label = label.strip()
+        if label in wanted:
+            found.setdefault(label, position)
+    columns = [column for column in columns if column in found]
+    positions = [found[column] for column in columns]
+
+    # A dict keeps the first occurrence of every distinct row in sheet order
+    distinct = {}
+    for row in rows:
+        record = []
+        for i in positions:
+            value = row[i]
+            if isinstance(value, str):
+                # calamine reports empty cells as '', treat them and placeholders such as 'N/A' as
+                # missing like read_excel does. Interning lets repeated parcel IDs and names share one
+                # object, so the dedup compares them by identity and keeps a single copy of each.
+                value = None if value in NA_STRINGS else sys.intern(value)
+            elif isinstance(value, float) and value.is_integer():
+                # calamine reports every number as a float, turn whole numbers back into ints like read_excel does
+                value = int(value)
+            record.append(value)
+        distinct[tuple(record)] = None
+
+    # Keep the cells as Python objects, so a blank cell does not turn a column of whole numbers into floats
+    return pd.DataFrame(list(distinct), columns=columns, dtype=object)
+
+def collapse_single_parcel(data, key_column):
+    """
+    Aggregates data holding at most one distinct parcel, without sorting or per-group deduplication.
+    
+    Parameters:
+        data (pandas.DataFrame): Categorical parcel, name and acreage columns.
+        key_column (str): Column identifying the parcel.
+    """
+    # An empty sheet has no parcels, otherwise every row belongs to the one parcel
+    n_groups = min(len(data), 1)
+    return pd.DataFrame({
+        key_column: data[key_column].iloc[:n_groups].astype('string[pyarrow]').array,
+        'Names': pd.array([';'.join(data['Name'].dropna().unique())] * n_groups, dtype='string[pyarrow]'),
+        'Acres in Unit': pd.array([','.join(data['Acres in Unit'].dropna().unique())] * n_groups, dtype='string[pyarrow]'),
+        'Gross Acres': pd.array([','.join(data['Gross acres'].dropna().unique())] * n_groups, dtype='string[pyarrow]')
+    })
+
+def aggregate_groups(data, key_column):
+    """
+    Aggregates the unique names and acreages of every parcel.
+    
+    Parameters:
+        data (pandas.DataFrame): Categorical parcel, name and acreage columns.
+        key_column (str): Column identifying the parcel.
+    """
+    # Sort rows by parcel once so every group is a contiguous run
+    codes, parcels = pd.factorize(data[key_column], sort=False, use_na_sentinel=False)
+    order = np.argsort(codes, kind='stable')
+    n_groups = len(parcels)
+    edges = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=n_groups))))
+
+    # Deduplicate all three columns on their category codes in one fused pass over the groups
+    names = data['Name'].cat
+    acres = data['Acres in Unit'].cat
+    gross = data['Gross acres'].cat
+    ids = np.empty((3, len(codes)), dtype=np.int64)
+    counts = np.empty((3, n_groups), dtype=np.int64)
+    fuse_agg(names.codes.to_numpy()[order], acres.codes.to_numpy()[order], gross.codes.to_numpy()[order], edges,
+             ids[0], ids[1], ids[2], counts[0], counts[1], counts[2])
+
+    # Every output column is its own contiguous Arrow array, so writers never transpose a 2-D block.
+    # Columns are labelled with their final output names up front.
+    return pd.DataFrame({
+        key_column: parcels.astype('string[pyarrow]').array,
+        'Names': join_unique(ids[0], counts[0], edges, names.categories.to_numpy(), ';'),
+        'Acres in Unit': join_unique(ids[1], counts[1], edges, acres.categories.to_numpy(), ','),
+        'Gross Acres': join_unique(ids[2], counts[2], edges, gross.categories.to_numpy(), ',')
+    })
+
+def aggregate(data, key_column):
+    """
+    Aggregates the unique names and acreages of every parcel, labelling the columns with their output names.
+    
+    Parameters:
+        data (pandas.DataFrame): Parcel, name and acreage columns as returned by read_columns.
+        key_column (str): Column identifying the parcel.
+    """
+    # Convert every column to Arrow-backed text once, so acreages are stringified in a single
+    # vectorized pass, then group and deduplicate on integer category codes
+    data = data.astype('string[pyarrow]').astype('category')
+
+    # Most lease workbooks cover a single parcel (or none), which needs no sorting or per-group dedup
+    if data[key_column].nunique(dropna=False) <= 1:
+        return collapse_single_parcel(data, key_column)
+    return aggregate_groups(data, key_column)
+
+def write_excel(aggregated_data, output_file):
+    """
+    Writes the aggregated data to an Excel file, streaming rows in xlsxwriter's constant-memory mode.
+    
+    Parameters:
+        aggregated_data (pandas.DataFrame): Aggregated data to save.
+        output_file (str): Path to the output Excel file.
+    """
+    # constant_memory flushes each row as soon as the next one starts, so rows must be written in
+    # order rather than column by column as DataFrame.to_excel does. Text is always written as text.
+    options = {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False}
+    with xlsxwriter.Workbook(output_file, options) as workbook:
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, list(aggregated_data.columns))
+        columns = [aggregated_data[column].to_numpy(dtype=object, na_value=None) for column in aggregated_data.columns]
+        for row, values in enumerate(zip(*columns), start=1):
+            worksheet.write_row(row, 0, values)